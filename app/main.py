@@ -1,6 +1,10 @@
 from fastapi import FastAPI
 from dotenv import load_dotenv
 import os
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.staticfiles import StaticFiles
@@ -15,8 +19,23 @@ from app.routes import (
     chat,
     onboarding,
 )
+from app.utils.openai_client import close_client
+from app.utils.gpt import calentar_conexion
 
 load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+
+# Mientras la app está arrancada los logs se escriben desde un hilo aparte:
+# las peticiones solo encolan el registro. Fuera de ese intervalo se escriben directamente.
+_root_logger = logging.getLogger()
+_log_handlers = list(_root_logger.handlers)
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_queue_handler = QueueHandler(_log_queue)
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # CORS abierto mientras probamos
@@ -41,9 +60,9 @@ try:
     from app.routes import stripe_routes, stripe_webhook
     app.include_router(stripe_routes.router)
     app.include_router(stripe_webhook.router)
-    print("[INFO] Stripe routes enabled")
+    logger.info("Stripe routes enabled")
 except Exception as e:
-    print("[WARN] Stripe routes disabled:", e)
+    logger.warning("Stripe routes disabled: %s", e)
 
 # --------- paths de frontend ---------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))   # .../app
@@ -128,11 +147,35 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
+@app.on_event("startup")
+def _start_log_listener():
+    if _queue_handler in _root_logger.handlers:
+        return
+    _log_listener.start()
+    _root_logger.handlers = [_queue_handler]
+
 # log de rutas al arrancar (aparece en Deploy Logs)
 @app.on_event("startup")
 async def _print_routes():
     try:
         paths = sorted({getattr(r, "path", "") for r in app.routes})
-        print("[ROUTES]", paths)
+        logger.info("Rutas: %s", paths)
     except Exception as e:
-        print("[ROUTES-ERROR]", e)
+        logger.error("No se pudieron listar las rutas: %s", e)
+
+# Precalienta el pool de OpenAI sin retrasar el arranque (útil si llegan planes nada más
+# arrancar, p. ej. al escalar workers con carga; pasados 30s sin uso la conexión se cierra)
+@app.on_event("startup")
+def _warm_openai_client():
+    threading.Thread(target=calentar_conexion, name="openai-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+def _close_openai_client():
+    close_client()
+
+@app.on_event("shutdown")
+def _stop_log_listener():
+    if _queue_handler not in _root_logger.handlers:
+        return
+    _root_logger.handlers = _log_handlers
+    _log_listener.stop()
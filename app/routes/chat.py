@@ -4,13 +4,12 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from sqlalchemy.orm import Session
-import os
 import logging
 import json
-from openai import OpenAI
 
 from app.database import get_db
 from app.models import Usuario
+from app.utils.openai_client import api_key, client
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -25,12 +24,6 @@ class ChatResponse(BaseModel):
     answer: str
     chat_uses_free_restantes: Optional[int] = None
 
-# Cliente OpenAI
-api_key = os.getenv("OPENAI_API_KEY", "").strip()
-client = None
-if api_key:
-    client = OpenAI(api_key=api_key)
-
 def get_fitness_prompt():
     """Prompt base para el asistente de fitness"""
     return """Eres YourGains AI, un entrenador personal y nutricionista experto con más de 10 años de experiencia. 
@@ -87,14 +80,15 @@ def call_openai_chat(message: str, user_email: str) -> str:
         
         answer = response.choices[0].message.content.strip()
         
-        # Log para debugging
-        logger.info(f"Chat request from {user_email}: {message[:50]}...")
-        logger.info(f"Chat response: {answer[:50]}...")
+        # Log para debugging (solo se formatea si INFO está activo)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Chat request from %s: %s...", user_email, message[:50])
+            logger.info("Chat response: %s...", answer[:50])
         
         return answer
         
-    except Exception as e:
-        logger.error(f"Error en OpenAI API: {str(e)}")
+    except Exception:
+        logger.exception("Error en OpenAI API")
         return f"❌ Error al procesar tu pregunta. Inténtalo de nuevo en unos segundos."
 
 def _demo_answer(msg: str) -> str:
@@ -176,7 +170,7 @@ def chat_endpoint(
         return ChatResponse(answer=answer, chat_uses_free_restantes=remaining)
         
     except Exception as e:
-        logger.error(f"Error en chat endpoint: {str(e)}")
+        logger.error("Error en chat endpoint: %s", e)
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 # Endpoint adicional para obtener estado del chat
@@ -295,7 +289,7 @@ def chat_stream(
             err = {"detail": he.detail}
             yield f"event: error\ndata: {json.dumps(err, ensure_ascii=False)}\n\n"
         except Exception as e:
-            logger.error(f"Error en chat/stream: {str(e)}")
+            logger.error("Error en chat/stream: %s", e)
             err = {"detail": "Error interno del servidor"}
             yield f"event: error\ndata: {json.dumps(err, ensure_ascii=False)}\n\n"
 
@@ -1,10 +1,11 @@
 # app/routes/onboarding.py
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
-import json
+import orjson
 
 from app.database import get_db
 from app.models import Usuario, Plan
@@ -66,8 +67,8 @@ def process_onboarding(
             lesiones=data.lesiones,
             alergias=data.alergias,
             restricciones_dieta=data.restricciones_dieta,
-            rutina=json.dumps(plan_data["rutina"], ensure_ascii=False),
-            dieta=json.dumps(plan_data["dieta"], ensure_ascii=False),
+            rutina=orjson.dumps(plan_data["rutina"]).decode(),
+            dieta=orjson.dumps(plan_data["dieta"]).decode(),
             motivacion=plan_data["motivacion"],
             fecha_creacion=datetime.utcnow()
         )
@@ -82,13 +83,14 @@ def process_onboarding(
         db.commit()
         db.refresh(nuevo_plan)
 
-        return {
+        # Serializado directo con orjson (sin pasar por jsonable_encoder)
+        return ORJSONResponse({
             "message": "Plan personalizado creado exitosamente",
             "plan_id": nuevo_plan.id,
             "rutina": plan_data["rutina"],
             "dieta": plan_data["dieta"],
             "motivacion": plan_data["motivacion"]
-        }
+        })
 
     except Exception as e:
         db.rollback()
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from fastapi.responses import Response
+from fastapi.responses import Response, ORJSONResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.auth_utils import get_current_user
@@ -8,8 +8,7 @@ from app.models import Usuario, Plan
 from datetime import datetime
 from fastapi.security import HTTPBearer
 from typing import List
-import json
-from app.utils.pdf_generator import generate_routine_pdf
+import orjson
 
 # 👇 importa tu generador GPT
 from app.utils.gpt import generar_plan_personalizado
@@ -119,9 +118,9 @@ def generar_rutina(
             # Plan parcial local (sin GPT)
             plan_generado = _generar_plan_basico_local(datos)
 
-        rutina_str = json.dumps(plan_generado["rutina"]) if isinstance(plan_generado["rutina"], (dict, list)) else plan_generado["rutina"]
-        dieta_str = json.dumps(plan_generado["dieta"]) if isinstance(plan_generado["dieta"], (dict, list)) else plan_generado["dieta"]
-        motivacion_str = json.dumps(plan_generado["motivacion"]) if isinstance(plan_generado["motivacion"], (dict, list)) else plan_generado["motivacion"]
+        rutina_str = orjson.dumps(plan_generado["rutina"]).decode() if isinstance(plan_generado["rutina"], (dict, list)) else plan_generado["rutina"]
+        dieta_str = orjson.dumps(plan_generado["dieta"]).decode() if isinstance(plan_generado["dieta"], (dict, list)) else plan_generado["dieta"]
+        motivacion_str = orjson.dumps(plan_generado["motivacion"]).decode() if isinstance(plan_generado["motivacion"], (dict, list)) else plan_generado["motivacion"]
 
         nuevo_plan = Plan(
             user_id=usuario.id,
@@ -150,11 +149,12 @@ def generar_rutina(
         db.commit()
         db.refresh(nuevo_plan)
 
-        return PlanResponse(
-            rutina=plan_generado["rutina"],
-            dieta=plan_generado["dieta"],
-            motivacion=plan_generado["motivacion"]
-        )
+        # Serializado directo con orjson (sin pasar por jsonable_encoder)
+        return ORJSONResponse({
+            "rutina": plan_generado["rutina"],
+            "dieta": plan_generado["dieta"],
+            "motivacion": plan_generado["motivacion"]
+        })
 
     except Exception as e:
         db.rollback()
@@ -169,9 +169,9 @@ def obtener_planes(
     planes = db.query(Plan).filter(Plan.user_id == usuario.id).order_by(Plan.fecha_creacion.desc()).all()
     return [
         PlanResponse(
-            rutina=json.loads(plan.rutina),
-            dieta=json.loads(plan.dieta),
-            motivacion=plan.motivacion if isinstance(plan.motivacion, str) else json.dumps(plan.motivacion)
+            rutina=orjson.loads(plan.rutina),
+            dieta=orjson.loads(plan.dieta),
+            motivacion=plan.motivacion if isinstance(plan.motivacion, str) else orjson.dumps(plan.motivacion).decode()
         )
         for plan in planes
     ]
@@ -198,12 +198,13 @@ def descargar_plan_pdf(
         
         # Preparar los datos del plan
         plan_data = {
-            "rutina": json.loads(plan.rutina) if isinstance(plan.rutina, str) else plan.rutina,
-            "dieta": json.loads(plan.dieta) if isinstance(plan.dieta, str) else plan.dieta,
-            "motivacion": plan.motivacion if isinstance(plan.motivacion, str) else json.loads(plan.motivacion)
+            "rutina": orjson.loads(plan.rutina) if isinstance(plan.rutina, str) else plan.rutina,
+            "dieta": orjson.loads(plan.dieta) if isinstance(plan.dieta, str) else plan.dieta,
+            "motivacion": plan.motivacion if isinstance(plan.motivacion, str) else orjson.loads(plan.motivacion)
         }
         
-        # Generar el PDF
+        # Generar el PDF (reportlab se importa solo al pedir un PDF, no al arrancar)
+        from app.utils.pdf_generator import generate_routine_pdf
         pdf_content = generate_routine_pdf(plan_data, usuario.email)
         
         # Crear nombre de archivo con fecha
@@ -242,12 +243,13 @@ def descargar_ultimo_plan_pdf(
         
         # Preparar los datos del plan
         plan_data = {
-            "rutina": json.loads(plan.rutina) if isinstance(plan.rutina, str) else plan.rutina,
-            "dieta": json.loads(plan.dieta) if isinstance(plan.dieta, str) else plan.dieta,
-            "motivacion": plan.motivacion if isinstance(plan.motivacion, str) else json.loads(plan.motivacion)
+            "rutina": orjson.loads(plan.rutina) if isinstance(plan.rutina, str) else plan.rutina,
+            "dieta": orjson.loads(plan.dieta) if isinstance(plan.dieta, str) else plan.dieta,
+            "motivacion": plan.motivacion if isinstance(plan.motivacion, str) else orjson.loads(plan.motivacion)
         }
         
-        # Generar el PDF
+        # Generar el PDF (reportlab se importa solo al pedir un PDF, no al arrancar)
+        from app.utils.pdf_generator import generate_routine_pdf
         pdf_content = generate_routine_pdf(plan_data, usuario.email)
         
         # Crear nombre de archivo con fecha
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Any
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional, Any, Union
 
 # ---------- PLAN ----------
 
@@ -21,6 +21,40 @@ class PlanRequest(BaseModel):
     alergias: Optional[str] = None
     restricciones_dieta: Optional[str] = None
 
+# Estructura que devuelve GPT (validada con pydantic-core)
+class Ejercicio(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    nombre: str
+    series: Union[int, str]
+    repeticiones: str
+    descanso: str
+
+class DiaRutina(BaseModel):
+    dia: str
+    ejercicios: List[Ejercicio]
+
+class Rutina(BaseModel):
+    dias: List[DiaRutina]
+    consejos: List[str]
+
+class Macros(BaseModel):
+    proteinas: Union[int, float]
+    hidratos: Union[int, float]
+    grasas: Union[int, float]
+
+class Comida(BaseModel):
+    nombre: str
+    kcal: Union[int, float]
+    macros: Macros
+    alimentos: List[str]
+    alternativas: List[str]
+
+class Dieta(BaseModel):
+    resumen: str
+    comidas: List[Comida]
+    consejos_finales: List[str]
+
 class PlanResponse(BaseModel):
     rutina: Any
     dieta: Any
@@ -1,109 +1,277 @@
 import os
-import json
-import regex as re
-from dotenv import load_dotenv
-from app.schemas import PlanRequest
-from openai import OpenAI
+import hashlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from string import Template
+from pydantic import BaseModel
+from app.schemas import PlanRequest, Rutina, Dieta
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, LengthFinishReasonError
+from app.utils.openai_client import client
+from app.utils.plan_cache import clave_perfil, obtener_o_generar, dias_entrenamiento
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
 
-def generar_plan_personalizado(datos):
-    if datos.sexo.lower() in ["hombre", "masculino", "male"]:
-        tmb = 10 * datos.peso + 6.25 * datos.altura - 5 * datos.edad + 5
-    else:
-        tmb = 10 * datos.peso + 6.25 * datos.altura - 5 * datos.edad - 161
+# Modelo para rutina/dieta (Structured Outputs garantiza el esquema)
+GPT_MODELO = os.getenv("OPENAI_PLAN_MODEL", "gpt-4o-mini")
 
-    mantenimiento = round(tmb * 1.55)
-    if "def" in datos.objetivo.lower():
-        ajuste_kcal = -300
-    elif "vol" in datos.objetivo.lower() or "gan" in datos.objetivo.lower():
-        ajuste_kcal = +300
-    else:
-        ajuste_kcal = 0
-    kcal_objetivo = mantenimiento + ajuste_kcal
+# Los reintentos los gestiona _crear_con_reintentos (sin los del SDK para no duplicarlos)
+_api = client.with_options(max_retries=0) if client is not None else None
 
-    idioma = datos.idioma.lower()
+# Backoff exponencial con jitter ante errores transitorios de OpenAI
+GPT_MAX_INTENTOS = 5
+GPT_ESPERA_MIN = 2.0   # segundos
+GPT_ESPERA_MAX = 30.0  # segundos
+_ERRORES_REINTENTABLES = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+# Máximo de llamadas simultáneas a OpenAI para planes: el resto espera turno en vez de provocar 429
+GPT_MAX_CONCURRENCIA = int(os.getenv("GPT_MAX_CONCURRENCY", "10"))
+_semaforo = threading.BoundedSemaphore(GPT_MAX_CONCURRENCIA)
 
-    texto_dieta = f"""
-Quiero que ahora generes una dieta hiperpersonalizada. Comienza explicando:
+# Tokens de salida por plan (una rutina semanal o 5 comidas caben de sobra)
+GPT_TOKENS_RUTINA = 1000
+GPT_TOKENS_DIETA = 1000
+# Si se conocen los días de entrenamiento, la rutina se ajusta a ellos
+GPT_TOKENS_RUTINA_BASE = 300
+GPT_TOKENS_RUTINA_DIA = 175
+GPT_TOKENS_RUTINA_MAX = 1600
 
-1. La Tasa Metabólica Basal calculada es: {round(tmb)} kcal/día.
-2. Las calorías de mantenimiento aproximadas son: {mantenimiento} kcal/día.
-3. Como el objetivo del usuario es {datos.objetivo}, se ajustarán las kcal a: {kcal_objetivo} kcal/día.
+# Rutina y dieta se piden a GPT en paralelo (la dieta va a este pool, del tamaño del semáforo
+# para que las dietas no hagan cola aquí mientras haya huecos libres hacia OpenAI)
+_executor = ThreadPoolExecutor(max_workers=GPT_MAX_CONCURRENCIA, thread_name_prefix="gpt-dieta")
+
+# Frases motivacionales (no hace falta pedírselas a GPT)
+_MOTIVACIONES = {
+    "es": [
+        "La constancia gana a la motivación: entrena hoy aunque no te apetezca.",
+        "Cada repetición cuenta. Tu yo del futuro te lo agradecerá.",
+        "No busques resultados en una semana, construye hábitos para toda la vida.",
+        "Tu único rival es la persona que eras ayer.",
+        "Come bien, descansa bien y entrena duro: el resto llega solo.",
+        "Los días difíciles son los que más te hacen progresar.",
+        "Pequeños progresos cada día suman grandes resultados.",
+        "La disciplina es elegir lo que quieres a largo plazo sobre lo que quieres ahora.",
+        "Tu cuerpo puede más de lo que tu mente cree. ¡Demuéstralo!",
+        "Hoy es un buen día para acercarte a tu objetivo.",
+        "El progreso no es lineal, pero sí acumulativo. Sigue adelante.",
+        "Confía en el proceso: cada comida y cada entreno te acercan a tu meta.",
+    ],
+    "en": [
+        "Consistency beats motivation: train today even if you don't feel like it.",
+        "Every rep counts. Your future self will thank you.",
+        "Don't chase results in a week, build habits for life.",
+        "Your only rival is who you were yesterday.",
+        "Eat well, rest well and train hard: the rest will follow.",
+        "The hard days are the ones that make you grow.",
+        "Small progress every day adds up to big results.",
+        "Discipline is choosing what you want most over what you want now.",
+        "Your body can do more than your mind believes. Prove it!",
+        "Today is a good day to get closer to your goal.",
+        "Progress isn't linear, but it adds up. Keep going.",
+        "Trust the process: every meal and every workout gets you closer.",
+    ],
+}
+
+
+# ---------- prompts ----------
+# Las instrucciones fijas van primero, en el mensaje de sistema (idéntico byte a byte entre
+# usuarios, así OpenAI puede reutilizar el prefijo cacheado); los datos del usuario van al final.
+
+_SISTEMA_RUTINA = """Eres un entrenador profesional de fuerza. Genera la rutina de entrenamiento del usuario.
+
+Genera una rutina personalizada según el perfil:
+- En "dias", un elemento por día de entrenamiento (ej. "Lunes") con sus ejercicios.
+- Cada ejercicio con nombre, series, repeticiones y descanso (ej. "90 segundos").
+- Las repeticiones SIEMPRE son rangos en texto: "8-10", "12-15", etc.
+- En "consejos", recomendaciones como "Calienta bien antes de cada sesión" o "Estira al finalizar cada rutina".
+"""
 
-Ahora, crea una dieta estructurada en 5 comidas al día. Usa los siguientes alimentos de preferencia:
+_SISTEMA_DIETA = """Eres un nutricionista deportivo profesional. Genera una dieta hiperpersonalizada para el usuario.
+
+En "resumen" explica la Tasa Metabólica Basal, las calorías de mantenimiento y el ajuste calórico
+según el objetivo, con las cifras que se te indican.
+
+Crea una dieta estructurada en 5 comidas al día. Usa los siguientes alimentos de preferencia:
 - Frutas: dátiles (preentreno), sandía, plátano, manzana.
 - Verduras: brócoli, coliflor, lechuga, tomate, aguacate.
 - Proteínas: leche, yogur, frutos secos, mantequilla de cacahuete, atún, pollo, ternera, pescado, queso, fuet, proteína en polvo (si el usuario la tiene).
 - Hidratos: arroz, avena (gachas en desayuno), pan, patata, ñoquis, cereales tipo cornflakes.
 - Grasas: aceite de oliva, frutos secos, aguacate.
 
-Formato obligatorio de salida en JSON:
-
-"dieta": {{
-  "resumen": "Explicación de TMB y ajuste calórico",
-  "comidas": [
-    {{
-      "nombre": "Desayuno",
-      "kcal": 500,
-      "macros": {{
-        "proteinas": 35,
-        "hidratos": 50,
-        "grasas": 15
-      }},
-      "alimentos": [
-        "300ml leche semidesnatada - 150kcal",
-        "40g avena - 150kcal",
-        "1 plátano - 100kcal",
-        "15g mantequilla de cacahuete - 100kcal"
-      ],
-      "alternativas": [
-        "200ml yogur natural + 10g nueces",
-        "1 manzana + 2 tostadas con aguacate"
-      ]
-    }}
-  ],
-  "consejos_finales": [
-    "Beber al menos 3L de agua al día.",
-    "Añade una pizca de sal a las comidas. Si sudas mucho, repón electrolitos.",
-    "La comida preentreno debe incluir hidratos rápidos como dátiles, plátano o pan.",
-    "La comida postentreno debe incluir hidratos + proteínas. Si solo comes proteínas, se produce gluconeogénesis y se pierde su función de recuperación muscular.",
-    "Si tienes proteína en polvo, úsala para cuadrar macros y facilitar el aporte proteico."
-  ]
-}}
+Cada comida con su nombre, kcal, macros en gramos (proteinas, hidratos, grasas), alimentos con
+cantidad y kcal (ej. "300ml leche semidesnatada - 150kcal", "40g avena - 150kcal") y alternativas
+(ej. "200ml yogur natural + 10g nueces").
+
+En "consejos_finales" incluye:
+- Beber al menos 3L de agua al día.
+- Añade una pizca de sal a las comidas. Si sudas mucho, repón electrolitos.
+- La comida preentreno debe incluir hidratos rápidos como dátiles, plátano o pan.
+- La comida postentreno debe incluir hidratos + proteínas. Si solo comes proteínas, se produce gluconeogénesis y se pierde su función de recuperación muscular.
+- Si tienes proteína en polvo, úsala para cuadrar macros y facilitar el aporte proteico.
 """
 
-    texto_rutina = """
-Genera también una rutina personalizada según el perfil. Formato obligatorio:
-
-"rutina": {
-  "dias": [
-    {
-      "dia": "Lunes",
-      "ejercicios": [
-        {
-          "nombre": "Sentadillas",
-          "series": 4,
-          "repeticiones": "8-10",
-          "descanso": "90 segundos"
-        }
-      ]
-    }
-  ],
-  "consejos": [
-    "Calienta bien antes de cada sesión",
-    "Estira al finalizar cada rutina"
-  ]
-}
+_USUARIO_DIETA = Template("""$perfil
+Cálculo calórico:
+1. La Tasa Metabólica Basal calculada es: $tmb kcal/día.
+2. Las calorías de mantenimiento aproximadas son: $mantenimiento kcal/día.
+3. Como el objetivo del usuario es $objetivo, se ajustarán las kcal a: $kcal_objetivo kcal/día.
+""")
 
-IMPORTANTE: Las repeticiones deben ser strings como "8-10", "12-15", etc. NO números.
-"""
 
-    prompt = f"""
-Eres un entrenador profesional de fuerza y nutrición. Genera un plan completo.
+class _RespuestaRutina(BaseModel):
+    rutina: Rutina
+
+
+class _RespuestaDieta(BaseModel):
+    dieta: Dieta
+
+
+def _retry_after(error):
+    """Segundos indicados por la cabecera Retry-After (0 si no viene o no es un número)"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return min(GPT_ESPERA_MAX, float(response.headers.get("retry-after", 0)))
+    except ValueError:
+        return 0.0
+
+
+def _crear_con_reintentos(**kwargs):
+    """
+    chat.completions.parse con backoff exponencial + jitter en 429/5xx/timeouts.
+    El resto de errores (400, 401...) no se reintentan: fallan a la primera.
+    """
+    for intento in range(1, GPT_MAX_INTENTOS + 1):
+        try:
+            # El semáforo solo cubre la llamada: durante el backoff se libera el hueco
+            with _semaforo:
+                return _api.chat.completions.parse(**kwargs)
+        except _ERRORES_REINTENTABLES as e:
+            # Sin saldo (429 insufficient_quota) no es transitorio: reintentar solo retrasa el error
+            if intento == GPT_MAX_INTENTOS or getattr(e, "code", None) == "insufficient_quota":
+                raise
+            espera = random.uniform(GPT_ESPERA_MIN, min(GPT_ESPERA_MAX, GPT_ESPERA_MIN * 2 ** intento))
+            # Si OpenAI indica cuánto esperar (429/503), no reintentamos antes
+            espera = max(espera, _retry_after(e))
+            logger.warning(
+                "OpenAI %s (intento %d/%d), reintentando en %.1fs",
+                type(e).__name__, intento, GPT_MAX_INTENTOS, espera
+            )
+            time.sleep(espera)
+
+
+def _pedir_plan(sistema, usuario, esquema, max_tokens):
+    """
+    Lanza el prompt a GPT con Structured Outputs: la respuesta llega ya validada como `esquema`.
+    El límite de tokens es ajustado; si la respuesta se corta se repite una vez con el doble.
+    """
+    kwargs = dict(
+        model=GPT_MODELO,
+        messages=[
+            {"role": "system", "content": sistema},
+            {"role": "user", "content": usuario},
+        ],
+        temperature=0.85,
+        # Semilla por perfil: la salida es algo más estable para un mismo perfil (OpenAI no garantiza que sea idéntica)
+        seed=int.from_bytes(hashlib.blake2b(usuario.encode(), digest_size=4).digest(), "big"),
+        max_completion_tokens=max_tokens,
+        response_format=esquema
+    )
+    try:
+        response = _crear_con_reintentos(**kwargs)
+    except LengthFinishReasonError:
+        logger.warning("Plan %s cortado a %d tokens, reintentando con %d", esquema.__name__, max_tokens, 2 * max_tokens)
+        kwargs["max_completion_tokens"] = 2 * max_tokens
+        response = _crear_con_reintentos(**kwargs)
+
+    if response.usage is not None and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Plan %s: %d tokens generados", esquema.__name__, response.usage.completion_tokens)
+
+    mensaje = response.choices[0].message
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Respuesta cruda de GPT: %s...", (mensaje.content or "")[:200])
 
-Perfil del usuario:
+    if mensaje.parsed is None:
+        raise ValueError(f"GPT no devolvió un plan válido: {mensaje.refusal or 'respuesta vacía'}")
+    return mensaje.parsed
+
+
+def _tokens_rutina(dias):
+    if not dias:
+        return GPT_TOKENS_RUTINA
+    return min(GPT_TOKENS_RUTINA_MAX, GPT_TOKENS_RUTINA_BASE + GPT_TOKENS_RUTINA_DIA * dias)
+
+
+def _generar_rutina(perfil, dias=None):
+    respuesta = _pedir_plan(_SISTEMA_RUTINA, perfil, _RespuestaRutina, max_tokens=_tokens_rutina(dias))
+    return respuesta.rutina.model_dump()
+
+
+def _generar_dieta(perfil, objetivo, tmb, mantenimiento, kcal_objetivo):
+    usuario = _USUARIO_DIETA.substitute(
+        perfil=perfil,
+        objetivo=objetivo,
+        tmb=round(tmb),
+        mantenimiento=mantenimiento,
+        kcal_objetivo=kcal_objetivo,
+    )
+
+    respuesta = _pedir_plan(_SISTEMA_DIETA, usuario, _RespuestaDieta, max_tokens=GPT_TOKENS_DIETA)
+    return respuesta.dieta.model_dump()
+
+
+def calentar_conexion():
+    """
+    Abre una conexión con OpenAI al arrancar. Solo ahorra el handshake TLS si el primer plan
+    llega antes de que el pool cierre la conexión inactiva (keepalive_expiry, 30s).
+    """
+    if _api is None:
+        return
+    try:
+        _api.models.retrieve(GPT_MODELO)
+    except Exception as e:
+        logger.warning("No se pudo precalentar la conexión con OpenAI: %s", e)
+
+
+def generar_plan_personalizado(datos):
+    # Reintentos con el mismo perfil reutilizan el plan (o esperan al que está en curso)
+    return obtener_o_generar(clave_perfil(datos), lambda: _generar_plan(datos))
+
+
+@lru_cache(maxsize=4096)
+def _calcular_kcal(sexo, peso, altura, edad, objetivo):
+    """TMB (Mifflin-St Jeor), mantenimiento y kcal objetivo. Función pura: se cachea por perfil."""
+    objetivo = objetivo.lower()
+
+    tmb = 10 * peso + 6.25 * altura - 5 * edad
+    if sexo.lower() in ("hombre", "masculino", "male"):
+        tmb += 5
+    else:
+        tmb -= 161
+
+    mantenimiento = round(tmb * 1.55)
+    if "def" in objetivo:
+        ajuste_kcal = -300
+    elif "vol" in objetivo or "gan" in objetivo:
+        ajuste_kcal = +300
+    else:
+        ajuste_kcal = 0
+    return tmb, mantenimiento, mantenimiento + ajuste_kcal
+
+
+def _generar_plan(datos):
+    tmb, mantenimiento, kcal_objetivo = _calcular_kcal(datos.sexo, datos.peso, datos.altura, datos.edad, datos.objetivo)
+
+    idioma = datos.idioma.lower()
+
+    # /onboarding envía una lista y /generar-rutina un texto: se formatea una sola vez
+    materiales = datos.materiales if isinstance(datos.materiales, str) else ", ".join(datos.materiales)
+
+    perfil = f"""Perfil del usuario:
 - Edad: {datos.edad}
 - Altura: {datos.altura} cm
 - Peso: {datos.peso} kg
@@ -115,79 +283,33 @@ Perfil del usuario:
 - Puntos débiles: {datos.puntos_debiles or "ninguno"}
 - Lesiones: {datos.lesiones or "ninguna"}
 - Intensidad deseada: {datos.entrenar_fuerte or "media"}
-- Materiales disponibles: {datos.materiales}
+- Materiales disponibles: {materiales}
 - Alergias: {datos.alergias or "ninguna"}
 - Restricciones dieta: {datos.restricciones_dieta or "ninguna"}
 - Idioma: {idioma}
-
-{texto_dieta}
-{texto_rutina}
-
-IMPORTANTE: Devuelve únicamente un JSON válido, con esta estructura exacta:
-
-{{
-  "rutina": {{
-    "dias": [
-      {{
-        "dia": "Lunes",
-        "ejercicios": [
-          {{
-            "nombre": "Sentadillas",
-            "series": 4,
-            "repeticiones": "8-10",
-            "descanso": "90 segundos"
-          }}
-        ]
-      }}
-    ],
-    "consejos": ["Consejo 1", "Consejo 2"]
-  }},
-  "dieta": {{
-    "resumen": "Explicación de TMB y ajuste calórico",
-    "comidas": [
-      {{
-        "nombre": "Desayuno",
-        "kcal": 500,
-        "macros": {{
-          "proteinas": 35,
-          "hidratos": 50,
-          "grasas": 15
-        }},
-        "alimentos": ["alimento 1", "alimento 2"],
-        "alternativas": ["alternativa 1", "alternativa 2"]
-      }}
-    ],
-    "consejos_finales": ["Consejo 1", "Consejo 2"]
-  }},
-  "motivacion": "Frase motivacional breve y personalizada para el usuario"
-}}
-
-REGLAS CRÍTICAS:
-1. Las repeticiones SIEMPRE deben ser strings: "8-10", "12-15", etc.
-2. NO uses números para rangos de repeticiones
-3. NO escribas nada fuera del JSON
-4. NO des explicaciones antes ni después
-5. Solo responde con ese objeto JSON válido
 """
+    # /generar-rutina indica los días por semana (acotados a 1-7); /onboarding no
+    dias = dias_entrenamiento(datos)
+    if dias:
+        perfil += f"- Días de entrenamiento por semana: {dias}\n"
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.85
-    )
-
-    contenido = response.choices[0].message.content
-    print("Respuesta cruda de GPT:", contenido)
+    if client is None:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
 
-    # Buscar el primer bloque JSON que aparezca en la respuesta
-    json_match = re.search(r'\{[\s\S]*\}', contenido)
-    if not json_match:
-        raise ValueError("No se encontró un JSON válido en la respuesta de GPT")
+    # La dieta se genera en paralelo mientras este hilo pide la rutina
+    dieta_futura = _executor.submit(_generar_dieta, perfil, datos.objetivo, tmb, mantenimiento, kcal_objetivo)
+    try:
+        rutina = _generar_rutina(perfil, dias)
+    except Exception:
+        # Si la dieta aún está en cola no llega a pedirse; si ya empezó, termina y se descarta
+        dieta_futura.cancel()
+        raise
+    dieta = dieta_futura.result()
 
-    data = json.loads(json_match.group(0))
+    motivacion = random.choice(_MOTIVACIONES.get(idioma, _MOTIVACIONES["es"]))
 
     return {
-        "rutina": data["rutina"],
-        "dieta": data["dieta"],
-        "motivacion": data["motivacion"]
+        "rutina": rutina,
+        "dieta": dieta,
+        "motivacion": motivacion
     }
@@ -0,0 +1,25 @@
+import os
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+
+api_key = os.getenv("OPENAI_API_KEY", "").strip()
+
+# Un único cliente (y pool de conexiones) por proceso, compartido por plan y chat
+_http_client = None
+client = None
+if api_key:
+    _http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30.0),
+        # Conectar falla rápido; la generación de un plan sí puede tardar
+        timeout=httpx.Timeout(120.0, connect=5.0),
+    )
+    client = OpenAI(api_key=api_key, http_client=_http_client)
+
+
+def close_client():
+    """Cierra el pool de conexiones HTTP del cliente compartido"""
+    if _http_client is not None:
+        _http_client.close()
@@ -5,6 +5,7 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 from datetime import datetime
+from io import BytesIO
 import json
 from typing import Dict, Any
 
@@ -20,8 +21,6 @@ def generate_routine_pdf(plan_data: Dict[str, Any], user_email: str = "usuario")
     Returns:
         bytes: Contenido del PDF generado
     """
-    from io import BytesIO
-    
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=50, leftMargin=50, 
                            topMargin=60, bottomMargin=50)
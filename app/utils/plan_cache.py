@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import orjson
+
+PLAN_CACHE_MAXSIZE = 256
+PLAN_CACHE_TTL = 3600  # segundos
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # clave -> (expira_en, plan)
+_inflight = {}          # clave -> Future del plan que se está generando
+
+
+# Campos del perfil que influyen en el plan generado
+_CAMPOS_PERFIL = (
+    "edad", "altura", "peso", "sexo", "experiencia", "objetivo", "tipo_cuerpo",
+    "puntos_fuertes", "puntos_debiles", "lesiones", "entrenar_fuerte",
+    "alergias", "restricciones_dieta", "idioma",
+)
+
+
+def dias_entrenamiento(datos):
+    """Días de entrenamiento por semana acotados a 1-7 (None si la petición no los trae)"""
+    dias = getattr(datos, "dias_entrenamiento", None)
+    if dias is None:
+        return None
+    return max(1, min(7, int(dias)))
+
+
+def _normalizar(valor):
+    if isinstance(valor, str):
+        valor = " ".join(valor.lower().split())
+        return valor or None
+    if isinstance(valor, bool):
+        return str(valor).lower()
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    return valor
+
+
+def perfil_canonico(datos):
+    """
+    Perfil normalizado (minúsculas, espacios, orden de materiales, vacíos -> None)
+    para que peticiones equivalentes de /onboarding y /generar-rutina compartan plan.
+    """
+    perfil = {campo: _normalizar(getattr(datos, campo, None)) for campo in _CAMPOS_PERFIL}
+    perfil["dias_entrenamiento"] = dias_entrenamiento(datos)
+    materiales = datos.materiales
+    if isinstance(materiales, str):
+        materiales = materiales.split(",")
+    perfil["materiales"] = sorted({m for m in map(_normalizar, materiales) if m})
+    return perfil
+
+
+def clave_perfil(datos):
+    """Hash estable del perfil canónico: mismo perfil -> misma clave"""
+    raw = orjson.dumps(perfil_canonico(datos), option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def obtener_o_generar(clave, generar):
+    """
+    Devuelve el plan cacheado para `clave` o lo genera con `generar()`.
+    Si llegan varias peticiones iguales a la vez solo se genera una vez:
+    las demás esperan el resultado de la primera.
+    El plan devuelto es compartido, no debe modificarse.
+    """
+    with _lock:
+        entrada = _cache.get(clave)
+        if entrada is not None and entrada[0] > time.monotonic():
+            _cache.move_to_end(clave)
+            return entrada[1]
+
+        futura = _inflight.get(clave)
+        es_propietario = futura is None
+        if es_propietario:
+            futura = Future()
+            _inflight[clave] = futura
+
+    if not es_propietario:
+        return futura.result()
+
+    try:
+        plan = generar()
+    except BaseException as e:
+        # También KeyboardInterrupt/SystemExit: si no, quien espere esta clave se bloquearía para siempre
+        with _lock:
+            del _inflight[clave]
+        futura.set_exception(e)
+        raise
+
+    with _lock:
+        _cache[clave] = (time.monotonic() + PLAN_CACHE_TTL, plan)
+        _cache.move_to_end(clave)
+        while len(_cache) > PLAN_CACHE_MAXSIZE:
+            _cache.popitem(last=False)
+        del _inflight[clave]
+    futura.set_result(plan)
+    return plan